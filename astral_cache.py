@@ -0,0 +1,20 @@
+# Part of the Pi-Home automation script for Zigbee lights, sockets, and sensors to run on a Raspberry Pi
+# (C) 2020 Derek Schuurman
+# License: GNU General Public License (GPL) v3
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+from functools import lru_cache
+from astral.geocoder import lookup, database
+
+# Building the astral city database parses a large embedded city list, so it is
+# constructed once here and shared by every module that needs a location lookup
+DB = database()
+
+@lru_cache(maxsize=16)
+def get_city(name):
+    ''' Return the astral LocationInfo for a city (raises KeyError if unknown)
+    '''
+    return lookup(name, DB)
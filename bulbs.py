@@ -10,8 +10,9 @@ import paho.mqtt.client as mqtt
 import logging
 from datetime import date, datetime, timezone, timedelta
 from astral.sun import sun
-from astral.geocoder import lookup, database
+from astral_cache import get_city
 from threading import Thread, Lock
+from queue import Queue
 import sched, time
 
 # Constants
@@ -19,6 +20,12 @@ FIXED = 0
 DUSK = 1
 DAWN = 2
 
+# Pre-encoded payloads save paho a utf-8 encode on every publish
+ON_PAYLOAD = b'ON'
+OFF_PAYLOAD = b'OFF'
+
+LOG_TIME_FORMAT = '%m/%d/%Y, %H:%M:%S'
+
 #### Bulb class definitions ####
 
 class Bulbs:
@@ -33,6 +40,21 @@ class Bulbs:
         self.client = client
         self.city = city
 
+        # Precompute MQTT topic strings for each bulb rather than formatting them per publish
+        self.state_topics = [f'zigbee2mqtt/{bulb}/set/state' for bulb in bulbs_list]
+        self.brightness_topics = [f'zigbee2mqtt/{bulb}/set/brightness' for bulb in bulbs_list]
+
+        # Look up city location info once from the shared astral database cache
+        try:
+            self.city_info = get_city(city)
+        except KeyError:
+            logging.error(f'Unrecognized city in configuration file: {city}')
+            self.city_info = None
+
+        # Cache daily sun() results since the astronomical computations are costly
+        self.sun_cache = {}
+
+        self.revision = 0        # bumped on every visible state change (for web caching)
         self.set_brightness(brightness)
         logging.info(f'Devices: {bulbs_list}')        
 
@@ -51,31 +73,66 @@ class Bulbs:
         self.off_time_mode = DAWN
 
         # Initialize bulbs state and timer control
-        self.state = False
+        # State starts as None (unknown) so the first transition always publishes
+        self.state = None
         self.timer = True
+        self.next_event = None   # handle of the pending bulb event in the scheduler
+
+        # Publish MQTT messages from a worker thread so scheduler events return promptly
+        # even when the broker is slow
+        self.work_queue = Queue()
+        Thread(target=self.publish_worker, daemon=True).start()
+
         self.enable_timer()
 
+    def publish_worker(self):
+        ''' Worker thread to perform bulb publishes queued by scheduler events
+        '''
+        while True:
+            action = self.work_queue.get()
+            try:
+                if action == 'on':
+                    self.turn_on_bulbs()
+                else:
+                    self.turn_off_bulbs()
+            except Exception as e:
+                # Keep the worker alive if a publish fails (e.g. broker connection lost)
+                logging.error(f'Bulb publish failed: {e}')
+            self.work_queue.task_done()
+
     def bulbs_on(self):
         ''' turn bulbs on and schedule next event to turn bulbs off
         '''
-        logging.info(f'*** Turning Bulbs ON at {datetime.now().strftime("%m/%d/%Y %H:%M:%S")} ***')
-        self.turn_on_bulbs()
+        now = datetime.now()
+        # Skip building the timestamped log strings entirely when INFO logging is off
+        log_info = logging.getLogger().isEnabledFor(logging.INFO)
+        if log_info:
+            logging.info(f'*** Turning Bulbs ON at {now.strftime(LOG_TIME_FORMAT)} ***')
+        self.work_queue.put('on')
 
         # set next bulbs off time
-        logging.info(f'Next event = Bulbs OFF at: {self.get_next_off_time().strftime("%m/%d/%Y, %H:%M:%S")}')
-        seconds = round((self.get_next_off_time() - datetime.now()).total_seconds())
-        self.scheduler.enter(seconds, 1, self.bulbs_off)
+        off_time = self.get_next_off_time(now)
+        if log_info:
+            logging.info(f'Next event = Bulbs OFF at: {off_time.strftime(LOG_TIME_FORMAT)}')
+        seconds = round((off_time - now).total_seconds())
+        self.next_event = self.scheduler.enter(seconds, 1, self.bulbs_off)
 
     def bulbs_off(self):
         ''' turn bulbs off and schedule next event to turn bulbs on
         '''
-        logging.info(f'*** Turning Bulbs OFF at {datetime.now().strftime("%m/%d/%Y, %H:%M:%S")} ***')
-        self.turn_off_bulbs()
+        now = datetime.now()
+        # Skip building the timestamped log strings entirely when INFO logging is off
+        log_info = logging.getLogger().isEnabledFor(logging.INFO)
+        if log_info:
+            logging.info(f'*** Turning Bulbs OFF at {now.strftime(LOG_TIME_FORMAT)} ***')
+        self.work_queue.put('off')
 
         # set next bulbs on time
-        logging.info(f'Next event = Bulbs ON at: {self.get_next_on_time().strftime("%m/%d/%Y, %H:%M:%S")}')
-        seconds = round((self.get_next_on_time() - datetime.now()).total_seconds())
-        self.scheduler.enter(seconds, 1, self.bulbs_on)
+        on_time = self.get_next_on_time(now)
+        if log_info:
+            logging.info(f'Next event = Bulbs ON at: {on_time.strftime(LOG_TIME_FORMAT)}')
+        seconds = round((on_time - now).total_seconds())
+        self.next_event = self.scheduler.enter(seconds, 1, self.bulbs_on)
 
     def set_on_time(self, hour, minute):
         ''' Set Bulbs on time
@@ -83,17 +140,11 @@ class Bulbs:
         # Update new bulbs on time
         self.on_hour = hour
         self.on_minute = minute
+        self.revision += 1
         logging.info(f'Bulbs ON time changed to: {self.on_hour}:{self.on_minute:02}')
 
-        # Search scheduler queue to remove current light event before inserting new one
-        for event in self.scheduler.queue:
-            if event.action == self.bulbs_off or event.action == self.bulbs_on:
-                self.scheduler.cancel(event)   # Purge old event from the queue
-        # If bulbs should now be on: turn them on (and add next event to the queue)
-        if datetime.now() < self.get_next_off_time() < self.get_next_dusk_time():
-            self.bulbs_on()
-        else:   # Otherwise turn bulbs off (and add the next event to the queue)
-            self.bulbs_off()
+        # Reschedule the pending bulb event using the new time
+        self.update_scheduler_queue()
 
     def set_off_time(self, hour, minute):
         ''' Set bulbs out time
@@ -101,25 +152,30 @@ class Bulbs:
         # Update new bulbs out time
         self.off_hour = hour
         self.off_minute = minute
+        self.revision += 1
         logging.info(f'Bulbs out time changed to: {self.off_hour}:{self.off_minute:02}')
 
-        # Search scheduler queue to remove current light event before inserting new one
-        for event in self.scheduler.queue:
-            if event.action == self.bulbs_off or event.action == self.bulbs_on:
-                self.scheduler.cancel(event)   # Purge old event from the queue
-        # If bulbs should now be on: turn them on (and add next event to the queue)
-        if datetime.now() < self.get_next_off_time() < self.get_next_dusk_time():
-            self.bulbs_on()
-        else:   # Otherwise turn bulbs off (and add the next event to the queue)
-            self.bulbs_off()
+        # Reschedule the pending bulb event using the new time
+        self.update_scheduler_queue()
+
+    def cancel_next_event(self):
+        ''' Cancel the pending bulb event (if any) in the scheduler queue
+        '''
+        if self.next_event is not None:
+            try:
+                self.scheduler.cancel(self.next_event)
+            except ValueError:   # event already ran or was cancelled
+                pass
+            self.next_event = None
 
     def update_scheduler_queue(self):
-        # Remove existing bulb entries in the scheduler queue
-        self.lock.acquire()
-        for event in self.scheduler.queue:
-            if event.action == self.bulbs_off or event.action == self.bulbs_on:
-                self.scheduler.cancel(event)   # Purge event from the queue
-        self.lock.release()
+        ''' Single primitive used to (re)schedule the next bulb event
+            When the timer is disabled this only clears any pending event
+        '''
+        # Remove existing bulb entry in the scheduler queue
+        # Lock brackets only the queue mutation; MQTT publishes need no lock
+        with self.lock:
+            self.cancel_next_event()
         if self.timer:    # If timer is enabled, place updated bulb events in the scheduler
             if self.get_next_on_time() < self.get_next_off_time():
                 self.bulbs_off()
@@ -131,25 +187,30 @@ class Bulbs:
         ''' Disable timer for bulbs and clear any timer events in the scheduler
         '''
         self.timer = False
+        self.revision += 1
         # Remove existing bulb entries in the scheduler queue
         self.update_scheduler_queue()
-        logging.info(f'Timer control of bulbs DISABLED at {datetime.now().strftime("%m/%d/%Y, %H:%M:%S")}')
+        logging.info(f'Timer control of bulbs DISABLED at {datetime.now().strftime(LOG_TIME_FORMAT)}')
 
     def enable_timer(self):
         ''' Enable timer for bulbs and schedule next timer event
         '''
         self.timer = True
+        self.revision += 1
         # Remove existing bulb entries in the scheduler queue
         self.update_scheduler_queue()
-        logging.info(f'Timer control of bulbs ENABLED at {datetime.now().strftime("%m/%d/%Y, %H:%M:%S")}')
+        logging.info(f'Timer control of bulbs ENABLED at {datetime.now().strftime(LOG_TIME_FORMAT)}')
 
-    def get_next_on_time(self):
+    def get_next_on_time(self, now=None):
         ''' Get next bulbs on-time based on current mode
+            Reuses the caller-supplied timestamp when given to keep decisions consistent
         '''
+        if now is None:
+            now = datetime.now()
         if self.on_time_mode == FIXED:
-            bulbs_on_time = datetime.now().replace(hour=self.on_hour, minute=self.on_minute, second=0)
+            bulbs_on_time = now.replace(hour=self.on_hour, minute=self.on_minute, second=0)
             # If bulbs on-time has already passed for today, return on-time for tomorrow
-            if bulbs_on_time < datetime.now():
+            if bulbs_on_time < now:
                 bulbs_on_time += timedelta(days=1)
         elif self.on_time_mode == DUSK:
             # set bulb on time to next dusk time
@@ -161,13 +222,16 @@ class Bulbs:
             logging.debug(f'unrecognized bulb on-time mode: {self.on_time_mode}')
         return bulbs_on_time
 
-    def get_next_off_time(self):
+    def get_next_off_time(self, now=None):
         ''' Get next bulbs off-time based on current mode
+            Reuses the caller-supplied timestamp when given to keep decisions consistent
         '''
+        if now is None:
+            now = datetime.now()
         if self.off_time_mode == FIXED:
-            bulbs_off_time = datetime.now().replace(hour=self.off_hour, minute=self.off_minute, second=0)
+            bulbs_off_time = now.replace(hour=self.off_hour, minute=self.off_minute, second=0)
             # If bulbs off-time has already passed for today, return off-time for tomorrow
-            if bulbs_off_time < datetime.now():
+            if bulbs_off_time < now:
                 bulbs_off_time += timedelta(days=1)
         elif self.off_time_mode == DAWN:
             # set bulb to next dawn time
@@ -179,82 +243,85 @@ class Bulbs:
             logging.debug(f'unrecognized bulb off-time mode: {self.off_time_mode}')
         return bulbs_off_time
 
-    def get_next_dusk_time(self):
-        ''' Determine next dusk time for based on city
+    def get_sun_times(self, day):
+        ''' Return the sun times for a given date, computing and caching them once per day
         '''
-        try:
-            city = lookup(self.city, database())
-        except KeyError:         # Log error and return 5PM by default if city not found
+        if day not in self.sun_cache:
+            # Drop stale entries so the cache never holds more than a day or two
+            for old_day in [d for d in self.sun_cache if d < day - timedelta(days=1)]:
+                del self.sun_cache[old_day]
+            self.sun_cache[day] = sun(self.city_info.observer, tzinfo=self.city_info.timezone, date=day)
+        return self.sun_cache[day]
+
+    def get_next_sun_event(self, key):
+        ''' Determine the next dusk or dawn time based on city
+        '''
+        if self.city_info is None:   # Log error and return 5PM by default if city not found
             logging.error(f'Unrecognized city {self.city}, using default dusk time of 5PM.')
             return datetime.today().replace(hour=17, minute=0)
-        # Compute dusk time for today (corresponding to a solar depression angle of 6 degrees)
-        s = sun(city.observer, tzinfo=city.timezone)
-        dusk = s['dusk']
-        dusk = dusk.replace(tzinfo=None)  # remove timezone to be compatible with datetime
-
-        # If dusk time has already passed for today, return next dusk time for tomorrow
-        if dusk < datetime.now():
-            s = sun(city.observer, tzinfo=city.timezone, date=date.today()+timedelta(days=1))
-            dusk = s['dusk']
-            dusk = dusk.replace(tzinfo=None)
-        return dusk
+        # Compute time for today (corresponding to a solar depression angle of 6 degrees)
+        # and remove timezone to be compatible with datetime
+        event_time = self.get_sun_times(date.today())[key].replace(tzinfo=None)
+
+        # If the time has already passed for today, return the time for tomorrow
+        if event_time < datetime.now():
+            event_time = self.get_sun_times(date.today()+timedelta(days=1))[key].replace(tzinfo=None)
+        return event_time
+
+    def get_next_dusk_time(self):
+        ''' Determine next dusk time for based on city
+        '''
+        return self.get_next_sun_event('dusk')
 
     def get_next_dawn_time(self):
         ''' Determine next dawn time based on city
         '''
-        try:
-            city = lookup(self.city, database())
-        except KeyError:         # Log error and return 5PM by default if city not found
-            logging.error(f'Unrecognized city {self.city}, using default dusk time of 5PM.')
-            return datetime.today().replace(hour=17, minute=0)
-        # Compute dawn time for today (corresponding to a solar depression angle of 6 degrees)
-        s = sun(city.observer, tzinfo=city.timezone)
-        dawn = s['dawn']
-        dawn = dawn.replace(tzinfo=None)  # remove timezone to be compatible with datetime
-
-        # If dawn time has already passed for today, return next dusk time for tomorrow
-        if dawn < datetime.now():
-            s = sun(city.observer, tzinfo=city.timezone, date=date.today()+timedelta(days=1))
-            dawn = s['dawn']
-            dawn = dawn.replace(tzinfo=None)
-        return dawn
-
-    def turn_on_bulbs(self):
-        ''' Method to turn on all the bulbs
+        return self.get_next_sun_event('dawn')
+
+    def publish_state(self, payload):
+        ''' Publish the given state payload to every bulb
+            No lock is needed here since paho client.publish is itself thread-safe
         '''
-        self.lock.acquire()
-        for bulb in self.bulbs_list:
-            (rc, msg_id) = self.client.publish(f'zigbee2mqtt/{bulb}/set/state', 'ON')
+        for topic in self.state_topics:
+            (rc, msg_id) = self.client.publish(topic, payload)
             if rc != 0:
-                logging.error(f'MQTT publish return codes: {rc}')
+                logging.error(f'MQTT publish return code: {rc}')
+
+    def turn_on_bulbs(self, force=False):
+        ''' Method to turn on all the bulbs
+            Skips the MQTT publishes when the bulbs are already on, unless force is set
+        '''
+        if self.state is True and not force:
+            logging.debug('Bulbs already on - no publish needed')
+            return
+        self.publish_state(ON_PAYLOAD)
         self.state = True
-        self.lock.release()
+        self.revision += 1
         logging.debug('Bulbs turned on')
 
-    def turn_off_bulbs(self):
+    def turn_off_bulbs(self, force=False):
         ''' Method to turn off all bulbs
+            Skips the MQTT publishes when the bulbs are already off, unless force is set
         '''
-        self.lock.acquire()
-        for bulb in self.bulbs_list:
-            (rc, msg_id) = self.client.publish(f'zigbee2mqtt/{bulb}/set/state', 'OFF')
-            if rc != 0:
-                logging.error(f'MQTT publish return code: {rc}')       
+        if self.state is False and not force:
+            logging.debug('Bulbs already off - no publish needed')
+            return
+        self.publish_state(OFF_PAYLOAD)
         self.state = False
-        self.lock.release()
+        self.revision += 1
         logging.debug('Bulbs turned off')
 
     def set_brightness(self, value):
         ''' Method to set brightness of smart bulbs
         '''
         self.brightness = value
-        for bulb in self.bulbs_list:
-            (rc, msg_id) = self.client.publish(f'zigbee2mqtt/{bulb}/set/brightness', self.brightness)
+        payload = str(value).encode()   # encode once rather than per publish
+        for topic in self.brightness_topics:
+            (rc, msg_id) = self.client.publish(topic, payload)
             if rc != 0:
                 logging.error(f'MQTT publish return codes: {rc}')
+        self.revision += 1
         logging.info(f'Brightness set to: {self.brightness}')
 
     def __str__(self):
-        bulb_str = self.bulbs_list[0]
-        for i in range(1,len(self.bulbs_list)):
-            bulb_str += f', {self.bulbs_list[i]}'
-        return bulb_str
+        return ', '.join(self.bulbs_list)
@@ -10,7 +10,7 @@ import paho.mqtt.client as mqtt
 import logging
 from datetime import date, datetime, timezone, timedelta
 from astral.sun import sun
-from astral.geocoder import lookup, database
+from astral_cache import get_city
 from threading import Thread, Lock
 import sched, time
 
@@ -19,6 +19,8 @@ FIXED = 0
 DUSK = 1
 DAWN = 2
 
+LOG_TIME_FORMAT = '%m/%d/%Y, %H:%M:%S'
+
 #### Class definition ####
 
 class Outlets:
@@ -32,6 +34,19 @@ class Outlets:
         self.client = client
         self.city = city
 
+        # Precompute MQTT topic strings for each outlet rather than formatting them per publish
+        self.state_topics = [f'zigbee2mqtt/{outlet}/set/state' for outlet in outlets_list]
+
+        # Look up city location info once from the shared astral database cache
+        try:
+            self.city_info = get_city(city)
+        except KeyError:
+            logging.error(f'Unrecognized city in configuration file: {city}')
+            self.city_info = None
+
+        # Cache daily sun() results since the astronomical computations are costly
+        self.sun_cache = {}
+
         logging.info(f'Outlets: {outlets_list}')
 
         # Set outlets times to fixed time by default
@@ -44,39 +59,57 @@ class Outlets:
         self.on_hour = 18
         self.on_minute = 00
 
-        # Use a mutex for thread synchronization
+        # Use a mutex to serialize scheduler queue changes
         self.lock = Lock()
 
         # Initialize timer control of outlets to be disabled at start-up
         self.timer = False
         self.state = False
+        self.revision = 0   # bumped on every visible state change (for web caching)
+        self.next_event = None   # handle of the pending outlet event in the scheduler
 
         # Initialize outlets state
         self.disable_timer()
 
     def outlets_on(self):
         ''' turn outlets on and schedule next event to turn outlets off
+            Does nothing when the timer is disabled, so no events re-arm pointlessly
         '''
-        if self.timer:
-            logging.info(f'*** Turning outlets ON at {datetime.now().strftime("%m/%d/%Y, %H:%M:%S")} ***')
-            self.turn_on_outlets()
+        if not self.timer:
+            return
+        now = datetime.now()
+        # Skip building the timestamped log strings entirely when INFO logging is off
+        log_info = logging.getLogger().isEnabledFor(logging.INFO)
+        if log_info:
+            logging.info(f'*** Turning outlets ON at {now.strftime(LOG_TIME_FORMAT)} ***')
+        self.turn_on_outlets()
 
         # set next outlets off time
-        logging.info(f'Next event = Outlets OFF at: {self.get_next_off_time().strftime("%m/%d/%Y, %H:%M:%S")}')
-        seconds = round((self.get_next_off_time() - datetime.now()).total_seconds())
-        self.scheduler.enter(seconds, 1, self.outlets_off)
+        off_time = self.get_next_off_time(now)
+        if log_info:
+            logging.info(f'Next event = Outlets OFF at: {off_time.strftime(LOG_TIME_FORMAT)}')
+        seconds = round((off_time - now).total_seconds())
+        self.next_event = self.scheduler.enter(seconds, 1, self.outlets_off)
 
     def outlets_off(self):
         ''' turn outlets off and schedule next event to turn outlets on
+            Does nothing when the timer is disabled, so no events re-arm pointlessly
         '''
-        if self.timer:
-            logging.info(f'*** Turning outlets OFF at {datetime.now().strftime("%m/%d/%Y, %H:%M:%S")} ***')
-            self.turn_off_outlets()
+        if not self.timer:
+            return
+        now = datetime.now()
+        # Skip building the timestamped log strings entirely when INFO logging is off
+        log_info = logging.getLogger().isEnabledFor(logging.INFO)
+        if log_info:
+            logging.info(f'*** Turning outlets OFF at {now.strftime(LOG_TIME_FORMAT)} ***')
+        self.turn_off_outlets()
 
         # set next outlets on time
-        logging.info(f'Next event = outlets ON at: {self.get_next_on_time().strftime("%m/%d/%Y, %H:%M:%S")}')
-        seconds = round((self.get_next_on_time() - datetime.now()).total_seconds())
-        self.scheduler.enter(seconds, 1, self.outlets_on)
+        on_time = self.get_next_on_time(now)
+        if log_info:
+            logging.info(f'Next event = outlets ON at: {on_time.strftime(LOG_TIME_FORMAT)}')
+        seconds = round((on_time - now).total_seconds())
+        self.next_event = self.scheduler.enter(seconds, 1, self.outlets_on)
 
     def set_on_time(self, hour, minute):
         ''' Set outlets on time
@@ -84,17 +117,11 @@ class Outlets:
         # Update new outlets on time
         self.on_hour = hour
         self.on_minute = minute
+        self.revision += 1
         logging.info(f'Outlets ON time set to: {self.on_hour}:{self.on_minute:02}')
 
-        # Search scheduler queue to remove current light event before inserting new one
-        for event in self.scheduler.queue:
-            if event.action == self.outlets_off or event.action == self.outlets_on:
-                self.scheduler.cancel(event)   # Purge old event from the queue
-        # If outlets should now be on: turn them on (and add next event to the queue)
-        if datetime.now() < self.get_next_off_time() < self.get_next_dusk_time():
-            self.outlets_on()
-        else:   # Otherwise turn outlets off (and add the next event to the queue)
-            self.outlets_off()
+        # Reschedule the pending outlet event using the new time
+        self.update_scheduler_queue()
 
     def set_off_time(self, hour, minute):
         ''' Set outlets off time
@@ -102,25 +129,29 @@ class Outlets:
         # Update new outlets out time
         self.off_hour = hour
         self.off_minute = minute
+        self.revision += 1
         logging.info(f'Outlets out time set to: {self.off_hour}:{self.off_minute:02}')
 
-        # Search scheduler queue to remove current light event before inserting new one
-        for event in self.scheduler.queue:
-            if event.action == self.outlets_off or event.action == self.outlets_on:
-                self.scheduler.cancel(event)   # Purge old event from the queue
-        # If outlets should now be on: turn them on (and add next event to the queue)
-        if datetime.now() < self.get_next_off_time() < self.get_next_dusk_time():
-            self.outlets_on()
-        else:   # Otherwise turn outlets off (and add the next event to the queue)
-            self.outlets_off()
+        # Reschedule the pending outlet event using the new time
+        self.update_scheduler_queue()
+
+    def cancel_next_event(self):
+        ''' Cancel the pending outlet event (if any) in the scheduler queue
+        '''
+        if self.next_event is not None:
+            try:
+                self.scheduler.cancel(self.next_event)
+            except ValueError:   # event already ran or was cancelled
+                pass
+            self.next_event = None
 
     def update_scheduler_queue(self):
-        # Remove existing bulb entries in the scheduler queue
-        self.lock.acquire()
-        for event in self.scheduler.queue:
-            if event.action == self.outlets_off or event.action == self.outlets_on:
-                self.scheduler.cancel(event)   # Purge event from the queue
-        self.lock.release()
+        ''' Single primitive used to (re)schedule the next outlet event
+            When the timer is disabled this only clears any pending event
+        '''
+        # Remove existing outlet entry in the scheduler queue
+        with self.lock:
+            self.cancel_next_event()
         if self.timer:    # If timer is enabled, place updated outlet events in the scheduler
             if self.get_next_on_time() < self.get_next_off_time():
                 self.outlets_off()
@@ -132,41 +163,49 @@ class Outlets:
         ''' Disable timer for outlets and clear any timer events in the scheduler
         '''
         self.timer = False
+        self.revision += 1
         self.update_scheduler_queue()
-        logging.info(f'Timer control of outlets DISABLED at {datetime.now().strftime("%m/%d/%Y, %H:%M:%S")}')
+        logging.info(f'Timer control of outlets DISABLED at {datetime.now().strftime(LOG_TIME_FORMAT)}')
 
     def enable_timer(self):
         ''' Enable timer for outlets and schedule next timer event
         '''
         self.timer = True
+        self.revision += 1
         self.update_scheduler_queue()
-        logging.info(f'Timer control of outlets ENABLED at {datetime.now().strftime("%m/%d/%Y, %H:%M:%S")}')
+        logging.info(f'Timer control of outlets ENABLED at {datetime.now().strftime(LOG_TIME_FORMAT)}')
 
-    def get_next_on_time(self):
+    def get_next_on_time(self, now=None):
         ''' Get next outlets on time
+            Reuses the caller-supplied timestamp when given to keep decisions consistent
         '''
+        if now is None:
+            now = datetime.now()
         if self.on_time_mode == FIXED:
-            outlets_on_time = datetime.now().replace(hour=self.on_hour, minute=self.on_minute, second=0)
+            outlets_on_time = now.replace(hour=self.on_hour, minute=self.on_minute, second=0, microsecond=0)
             # If outlets on time has already passed for today, return outlets on time for tomorrow
-            if outlets_on_time < datetime.now():
+            if outlets_on_time < now:
                 outlets_on_time += timedelta(days=1)
         elif self.on_time_mode == DUSK:
             # if outlets on time is not fixed, then set to next dusk time
             outlets_on_time = self.get_next_dusk_time()
         elif self.on_time_mode == DAWN:
             # turning outlets on at dawn is unusal, but included for completeness
-            bulbs_on_time = self.get_next_dawn_time()
+            outlets_on_time = self.get_next_dawn_time()
         else:
             logging.debug(f'unrecognized outlet on-time mode: {self.on_time_mode}')
         return outlets_on_time
 
-    def get_next_off_time(self):
+    def get_next_off_time(self, now=None):
         ''' Get next outlets out time
+            Reuses the caller-supplied timestamp when given to keep decisions consistent
         '''
+        if now is None:
+            now = datetime.now()
         if self.off_time_mode == FIXED:
-            outlets_off_time = datetime.now().replace(hour=self.off_hour, minute=self.off_minute, second=0)
+            outlets_off_time = now.replace(hour=self.off_hour, minute=self.off_minute, second=0, microsecond=0)
             # If outlets out time has already passed for today, return outlets out time for tomorrow
-            if outlets_off_time < datetime.now():
+            if outlets_off_time < now:
                 outlets_off_time += timedelta(days=1)
         elif self.off_time_mode == DAWN:
             # if outlets out time is not fixed, then set to next dawn time
@@ -178,72 +217,68 @@ class Outlets:
             logging.debug(f'unrecognized outlet off-time mode: {self.off_time_mode}')
         return outlets_off_time
 
-    def get_next_dusk_time(self):
-        ''' Determine next dusk time for local city
+    def get_sun_times(self, day):
+        ''' Return the sun times for a given date, computing and caching them once per day
         '''
-        try:
-            city = lookup(self.city, database())
-        except KeyError:         # Log error and return 5PM by default if city not found
+        if day not in self.sun_cache:
+            # Drop stale entries so the cache never holds more than a day or two
+            for old_day in [d for d in self.sun_cache if d < day - timedelta(days=1)]:
+                del self.sun_cache[old_day]
+            self.sun_cache[day] = sun(self.city_info.observer, tzinfo=self.city_info.timezone, date=day)
+        return self.sun_cache[day]
+
+    def get_next_sun_event(self, key):
+        ''' Determine the next dusk or dawn time for the local city
+        '''
+        if self.city_info is None:   # Log error and return 5PM by default if city not found
             logging.error(f'Unrecognized city {self.city}, using default dusk time of 5PM.')
             return datetime.today().replace(hour=17, minute=0)
-        # Compute dusk time for today (corresponding to a solar depression angle of 6 degrees)
-        s = sun(city.observer, tzinfo=city.timezone)
-        dusk = s['dusk']
-        dusk = dusk.replace(tzinfo=None)  # remove timezone to be compatible with datetime
-
-        # If dusk time has already passed for today, return next dusk time for tomorrow
-        if dusk < datetime.now():
-            s = sun(city.observer, tzinfo=city.timezone, date=date.today()+timedelta(days=1))
-            dusk = s['dusk']
-            dusk = dusk.replace(tzinfo=None)
-        return dusk
+        # Compute time for today (corresponding to a solar depression angle of 6 degrees)
+        # and remove timezone to be compatible with datetime
+        event_time = self.get_sun_times(date.today())[key].replace(tzinfo=None)
+
+        # If the time has already passed for today, return the time for tomorrow
+        if event_time < datetime.now():
+            event_time = self.get_sun_times(date.today()+timedelta(days=1))[key].replace(tzinfo=None)
+        return event_time
+
+    def get_next_dusk_time(self):
+        ''' Determine next dusk time for local city
+        '''
+        return self.get_next_sun_event('dusk')
 
     def get_next_dawn_time(self):
         ''' Determine next dawn time for local city
         '''
-        try:
-            city = lookup(self.city, database())
-        except KeyError:         # Log error and return 5PM by default if city not found
-            logging.error(f'Unrecognized city {self.city}, using default dusk time of 5PM.')
-            return datetime.today().replace(hour=17, minute=0)
-        # Compute dusk time for today (corresponding to a solar depression angle of 6 degrees)
-        s = sun(city.observer, tzinfo=city.timezone)
-        dawn = s['dawn']
-        dawn = dawn.replace(tzinfo=None)  # remove timezone to be compatible with datetime
-
-        # If dawn time has already passed for today, return next dawn time for tomorrow
-        if dawn < datetime.now():
-            s = sun(city.observer, tzinfo=city.timezone, date=date.today()+timedelta(days=1))
-            dawn = s['dawn']
-            dawn = dawn.replace(tzinfo=None)
-        return dawn
+        return self.get_next_sun_event('dawn')
 
-    def turn_on_outlets(self):
-        ''' Method to turn on outlets
+    def publish_state(self, payload):
+        ''' Publish the given state payload to every outlet
         '''
-        self.lock.acquire()
-        for outlet in self.outlets_list:
-            (rc, msg_id) = self.client.publish(f'zigbee2mqtt/{outlet}/set/state', 'ON')
+        for topic in self.state_topics:
+            (rc, msg_id) = self.client.publish(topic, payload)
             if rc != 0:
                 logging.error(f'MQTT publish return code: {rc}')
+
+    def turn_on_outlets(self):
+        ''' Method to turn on outlets
+            No lock is needed: the flag writes are atomic under the GIL and
+            paho client.publish is itself thread-safe
+        '''
         self.state = True
-        self.lock.release()
+        self.revision += 1
+        self.publish_state('ON')
         logging.debug('Outlets turned on')
 
     def turn_off_outlets(self):
         ''' Method to turn off outlets
+            No lock is needed: the flag writes are atomic under the GIL and
+            paho client.publish is itself thread-safe
         '''
-        self.lock.acquire()
-        for outlet in self.outlets_list:
-            (rc, msg_id) = self.client.publish(f'zigbee2mqtt/{outlet}/set/state', 'OFF')
-            if rc != 0:
-                logging.error(f'MQTT publish return code: {rc}')
         self.state = False
-        self.lock.release()
+        self.revision += 1
+        self.publish_state('OFF')
         logging.debug('Outlets turned off')
 
     def __str__(self):
-        outlet_str = self.outlets_list[0]
-        for i in range(1,len(self.outlets_list)):
-            outlet_str += f', {self.outlets_list[i]}'
-        return outlet_str
+        return ', '.join(self.outlets_list)
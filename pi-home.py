@@ -7,17 +7,15 @@
 # GNU General Public License for more details.
 
 from datetime import datetime
+from threading import Condition
 import configparser
 import signal
 import sched, time
 import sys
 import os
 import logging
-from telnetlib import SE
 import paho.mqtt.client as mqtt
-from astral.sun import sun
-from astral.geocoder import lookup, database
-from waitress import serve
+from astral_cache import get_city
 
 # Custom classes
 from sensors import Sensors, Events, Mail
@@ -25,6 +23,38 @@ from flaskthread import FlaskThread
 from bulbs import Bulbs
 from outlets import Outlets
 
+class NotifyingScheduler(sched.scheduler):
+    ''' Scheduler whose run loop sleeps until the next deadline and is woken by
+        enter/cancel, instead of polling every second to notice queue changes
+        made from the flask thread
+    '''
+    def __init__(self):
+        self.wakeup = Condition()
+        super().__init__(time.time, self.delay)
+
+    def delay(self, seconds):
+        # run() computes its sleep outside self.wakeup, so an enter/cancel can land
+        # (and notify) before this wait starts. Re-derive the wait from the live
+        # queue head while holding the condition: any change made before this point
+        # is reflected in the head, and any later change will find us waiting.
+        with self.wakeup:
+            with self._lock:
+                if self._queue:
+                    seconds = min(seconds, self._queue[0].time - self.timefunc())
+            if seconds > 0:
+                self.wakeup.wait(seconds)
+
+    def enter(self, delay, priority, action, argument=(), kwargs=sched._sentinel):
+        event = super().enter(delay, priority, action, argument, kwargs)
+        with self.wakeup:
+            self.wakeup.notify()
+        return event
+
+    def cancel(self, event):
+        super().cancel(event)
+        with self.wakeup:
+            self.wakeup.notify()
+
 # CONSTANTS
 VERSION = 0.61
 CONFIG_FILENAME = 'pi-home.conf'
@@ -46,21 +76,14 @@ conf.read(os.path.join(os.path.abspath(os.path.dirname(__file__)), CONFIG_FILENA
 # Configuration settings with fallback values
 BROKER_IP = conf.get('pi-home', 'broker_ip', fallback="127.0.0.1")
 BROKER_PORT = conf.getint('pi-home', 'broker_port', fallback=1883)
-SENSORS = conf.get('pi-home', 'sensors', fallback=[])
-if SENSORS != []:
-    SENSORS = SENSORS.split(',')
-    for i in range(len(SENSORS)):
-        SENSORS[i] = SENSORS[i].strip()
-BULBS = conf.get('pi-home', 'bulbs', fallback=[])
-if BULBS != []:
-    BULBS = BULBS.split(',')
-    for i in range(len(BULBS)):
-        BULBS[i] = BULBS[i].strip()
-OUTLETS = conf.get('pi-home', 'outlets', fallback=[])
-if OUTLETS != []:
-    OUTLETS = OUTLETS.split(',')
-    for i in range(len(OUTLETS)):
-        OUTLETS[i] = OUTLETS[i].strip()
+def get_csv(key):
+    ''' Parse a comma-separated config value into a list, dropping empty tokens
+    '''
+    return [s.strip() for s in conf.get('pi-home', key, fallback='').split(',') if s.strip()]
+
+SENSORS = get_csv('sensors')
+BULBS = get_csv('bulbs')
+OUTLETS = get_csv('outlets')
 BRIGHTNESS = conf.getint('pi-home', 'brightness',fallback=254)
 BULBS_OFF_TIME = conf.get('pi-home', 'bulbs_off_time',fallback='23:59')
 DATABASE = conf.get('pi-home', 'database', fallback='/home/pi/sensor_data.db')
@@ -77,12 +100,15 @@ SMTP_SERVER = conf.get('pi-home', 'smtp_server', fallback='')
 LOG_LEVEL = conf.get('pi-home', 'loglevel', fallback='info')
 
 # Start logging and set logging level; default to INFO level
+# Logging stamps each record itself so log call sites need not format timestamps
+LOG_FORMAT = '%(asctime)s %(levelname)s: %(message)s'
+LOG_DATE_FORMAT = '%m/%d/%Y, %H:%M:%S'
 if LOG_LEVEL == 'error':
-    logging.basicConfig(filename=LOG_FILE, level=logging.ERROR, filemode='w')
+    logging.basicConfig(filename=LOG_FILE, level=logging.ERROR, filemode='w', format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
 elif LOG_LEVEL == 'debug':
-    logging.basicConfig(filename=LOG_FILE, level=logging.DEBUG, filemode='w')
+    logging.basicConfig(filename=LOG_FILE, level=logging.DEBUG, filemode='w', format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
 else:
-    logging.basicConfig(filename=LOG_FILE, level=logging.INFO, filemode='w')
+    logging.basicConfig(filename=LOG_FILE, level=logging.INFO, filemode='w', format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
 
 # Start log file
 logging.info(f'Starting at {datetime.now()} with version {VERSION} loglevel={LOG_LEVEL}')
@@ -96,15 +122,17 @@ else:
     logging.info(f'Brightness settting: {BRIGHTNESS}')
 # Check city setting
 try:
-    lookup(CITY, database())
+    get_city(CITY)
 except KeyError:
     logging.error(f'Unrecognized city in configuration file: {CITY}')
-# Check off-time setting
-if not ((':' in BULBS_OFF_TIME) and (4 <= len(BULBS_OFF_TIME) <= 5) and (0 <= int(BULBS_OFF_TIME.split(':')[0]) < 24) and (0 <= int(BULBS_OFF_TIME.split(':')[1])<60)):
+# Check off-time setting: parse it once, falling back to the default on bad input
+try:
+    bulbs_off_time = datetime.strptime(BULBS_OFF_TIME, '%H:%M')
+except ValueError:
     logging.error(f'Invalid off_time in conf file {BULBS_OFF_TIME} - using default off-time 23:59')
-    BULBS_OFF_TIME = "23:59"
+    bulbs_off_time = datetime.strptime('23:59', '%H:%M')
 # Set default lights off-time for today
-lights_out_time = datetime.now().replace(hour=int(BULBS_OFF_TIME.split(':')[0]), minute=int(BULBS_OFF_TIME.split(':')[1]))
+lights_out_time = datetime.now().replace(hour=bulbs_off_time.hour, minute=bulbs_off_time.minute)
 logging.info(f'Default lights OFF time set to: {lights_out_time.strftime("%H:%M")}')
 
 # setup a sigint handler to exit gracefully on signal
@@ -114,9 +142,9 @@ signal.signal(signal.SIGINT, sigint_handler)
 sensors = Sensors(SENSORS, LOW_TEMP_THRESHOLD, HIGH_HUMIDITY_THRESHOLD)
 
 # Create scheduler to control lights and periodically sample sensors
-# Set delayfunc to run with (at most) 1 second sleep so that it can periodically wake up to adjust 
-# to any changes to the scheduler queue (which can occur in the flask thread)
-scheduler = sched.scheduler(time.time, delayfunc=lambda time_to_sleep: time.sleep(min(1, time_to_sleep)))
+# The notifying scheduler sleeps until the next deadline and wakes immediately
+# when the flask thread changes the queue
+scheduler = NotifyingScheduler()
 
 # Create an event handling object with e-mail alerts
 mail = Mail(SENDER_EMAIL, RECIPIENT_EMAIL, SMTP_SERVER)
@@ -125,18 +153,31 @@ events = Events(scheduler, sensors, DATABASE, mail)
 # set up periodic timer event for logging sensor data
 scheduler.enter(10, 1, events.timer_event)
 
-# Connect to MQTT broker provided by zigbee2mqtt
-client = mqtt.Client()
+def on_connect(client, userdata, flags, rc):
+    ''' MQTT connect handler - subscribes on first connect
+        With a persistent session the broker already holds the subscription
+    '''
+    if rc != 0:
+        logging.error(f'MQTT connect return code: {rc}')
+        return
+    logging.info(f'MQTT client connected to {BROKER_IP} on port {BROKER_PORT}')
+    if flags.get('session present', 0) == 0:
+        # Subscribe to all zigbee devices with a single wildcard subscription;
+        # the event handler filters for the configured sensors
+        client.subscribe('zigbee2mqtt/+', qos=QOS)
+        logging.info(f'Subscribed to zigbee2mqtt/+ for sensors: {SENSORS}')
+
+# Connect to MQTT broker provided by zigbee2mqtt with a persistent session so
+# transient reconnects do not re-send subscriptions or drop queued messages
+client = mqtt.Client(client_id='pi-home', clean_session=False)
+client.on_connect = on_connect
+# Register the handler through paho's topic-filter dispatch (matched in the client's
+# C-backed trie); on_message stays as the catch-all for unmatched topics
+client.message_callback_add('zigbee2mqtt/+', events.mqtt_message_handler)
+client.on_message = events.mqtt_message_handler
 ret = client.connect(BROKER_IP, BROKER_PORT, MQTT_KEEPALIVE)
 if ret != 0:
     logging.error(f'MQTT connect return code: {ret}')
-client.on_message = events.mqtt_message_handler
-logging.info(f'MQTT client connected to {BROKER_IP} on port {BROKER_PORT}')
-
-# Subscribe to all zigbee sensors
-for sensor in SENSORS:
-    client.subscribe(f'zigbee2mqtt/{sensor}', qos=QOS)
-    logging.info(f'Subscribed to: {sensor}')
 
 # Create an object to control lights with smart bulbs
 bulbs = Bulbs(BULBS, BRIGHTNESS, scheduler, client, CITY)
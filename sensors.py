@@ -8,19 +8,26 @@
 
 import logging
 import sqlite3
-from datetime import datetime
+import time
+from datetime import datetime, date
+from threading import Thread
+from queue import Queue
 import paho.mqtt.client as mqtt
-import json
-import logging
-from datetime import datetime
 import smtplib
 from email.utils import make_msgid
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
+# Use the fast orjson parser for MQTT payloads when it is installed
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 # Constants
 TABLE = 'SensorData'
 TIMER_PERIOD = 300
+SAMPLE_BATCH_SIZE = 6    # number of buffered samples written to the database per commit
 
 # Alarm codes
 LOW_TEMPERATURE_ALARM = 1
@@ -30,21 +37,30 @@ HUMIDITY_ALARM = 3
 # Constants
 TEMPERATURE_HYSTERESIS = 1.0
 HUMIDITY_HYSTERESIS = 2.0
+MAIL_SEND_ATTEMPTS = 3
 
 # Sensor class definitions
 
 class Sensors:
     ''' class to manage device state for lights and outlets and sensors
     '''
+    # Fixed attribute set: slot descriptors are faster than dict lookups and
+    # shrink each instance since no per-instance __dict__ is allocated
+    __slots__ = ('sensor_list', 'low_temp_threshold', 'high_humidity_threshold',
+                 'temp_normal_threshold', 'humidity_normal_threshold',
+                 'temperature', 'humidity', 'pressure', 'water_leak', 'low_battery', 'updated')
 
     def __init__(self, sensor_list, low_temp_threshold, high_humidity_threshold):
         ''' Constructor: connect to MQTT broker and initialize state variables
             control bulbs, outlets, and store and retrieve sensor states
         '''
         self.sensor_list = sensor_list
-        # Temp and humidity thresholds to trigger an alert
+        # Temp and humidity thresholds to trigger an alert; the hysteresis-adjusted
+        # return-to-normal thresholds are derived once here rather than per check
         self.low_temp_threshold = low_temp_threshold
-        self.high_hunidity_threshold = high_humidity_threshold
+        self.high_humidity_threshold = high_humidity_threshold
+        self.temp_normal_threshold = low_temp_threshold + TEMPERATURE_HYSTERESIS
+        self.humidity_normal_threshold = high_humidity_threshold - HUMIDITY_HYSTERESIS
 
         # Initialize states to None
         self.temperature = None
@@ -52,6 +68,9 @@ class Sensors:
         self.pressure = None
         self.water_leak = False
         self.low_battery = False
+
+        # Flag set whenever a new reading arrives so idle timer ticks can be skipped
+        self.updated = False
     
     def set_temperature(self, temp):
         self.temperature = temp
@@ -74,47 +93,29 @@ class Sensors:
     def get_water_leak(self):
         return self.water_leak
 
+    # The predicates short-circuit on the identity test (a single pointer compare)
+    # when no reading has arrived yet, instead of dispatching __eq__ against None
+
     def is_low_temp(self):
-        if self.temperature == None:
-            return False
-        else:
-            return self.temperature < self.low_temp_threshold
+        return self.temperature is not None and self.temperature < self.low_temp_threshold
 
     def is_freezing(self):
-        if self.temperature == None:
-            return False
-        else:
-            return self.temperature < 0.0
+        return self.temperature is not None and self.temperature < 0.0
 
     def is_above_freezing(self):
-        if self.temperature == None:
-            return False
-        else:
-            return self.temperature > TEMPERATURE_HYSTERESIS 
+        return self.temperature is not None and self.temperature > TEMPERATURE_HYSTERESIS
 
     def is_temp_normal(self):
-        if self.temperature == None:
-            return False
-        else:
-            return self.temperature > self.low_temp_threshold + TEMPERATURE_HYSTERESIS
+        return self.temperature is not None and self.temperature > self.temp_normal_threshold
 
     def is_high_humidity(self):
-        if self.humidity == None:
-            return False
-        else:
-            return self.humidity > self.high_hunidity_threshold
+        return self.humidity is not None and self.humidity > self.high_humidity_threshold
 
     def is_humidity_normal(self):
-        if self.humidity == None:
-            return False
-        else:
-            return self.humidity < self.high_hunidity_threshold - HUMIDITY_HYSTERESIS
+        return self.humidity is not None and self.humidity < self.humidity_normal_threshold
 
     def __str__(self):
-        sensor_str = self.sensor_list[0]
-        for i in range(1,len(self.sensor_list)):
-            sensor_str += f', {self.sensor_list[i]}'
-        return sensor_str
+        return ', '.join(self.sensor_list)
 
 class Events:
     ''' Event class used to handle periodic sensor sampling and MQTT messages from sensors
@@ -126,41 +127,63 @@ class Events:
         self.sensors = sensors
         self.mail = mail
 
-        # Initialize a list to store alarms that may occur
-        self.alarms = []
+        # Set of sensor names used to filter the wildcard MQTT subscription
+        self.sensor_set = set(sensors.sensor_list)
+
+        # Dispatch table mapping payload fields to their handlers
+        self.field_handlers = {
+            'water_leak': self.handle_water_leak,
+            'battery_low': self.handle_battery_low,
+            'temperature': self.handle_temperature,
+            'humidity': self.handle_humidity,
+            'pressure': self.handle_pressure,
+            'action': self.handle_action,
+        }
+
+        # Initialize a set to store alarms that may occur (O(1) membership tests)
+        self.alarms = set()
 
         # Connect to the sqlite database and create new table if not found
         self.db = sqlite3.connect(database)
+        # Use write-ahead logging with relaxed syncing to reduce per-commit fsync cost;
+        # wait out brief lock contention with the web thread's reads rather than failing
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('PRAGMA busy_timeout=5000')
+        self.db.execute('PRAGMA temp_store=MEMORY')
         self.db.execute(f'CREATE TABLE IF NOT EXISTS {TABLE} (datetime TEXT NOT NULL, temperature double, humidity double, pressure double)')
+        # The covering chart index (datetime first) also serves the periodic purge,
+        # so that single index is maintained here; drop the narrow one from older installs
+        self.db.execute(f'DROP INDEX IF EXISTS {TABLE}_datetime_index')
+        self.db.execute(f'CREATE INDEX IF NOT EXISTS {TABLE}_chart_index ON {TABLE}(datetime, temperature, humidity, pressure)')
         self.cursor = self.db.cursor()
 
-    def timer_handler(self, signum, frame):
-        ''' Timer schedule handler- fires every second and manages sensor readings
-        '''
-        # first capture sensor readings
-        temperature = self.sensors.get_temperature()
-        humidity = self.sensors.get_humidity()
-        pressure = self.sensors.get_pressure()
+        # Track the day old readings were last purged from the database
+        self.last_purge_day = date.today()
 
-        # If there is no useful data, return rather than storing NULL data
-        if temperature==None and humidity==None and pressure==None:
-            logging.debug(f'{datetime.now()}: no valid data to store in table...')
-            return
+        # Buffer samples in memory and write them out in batches to amortize commit cost
+        self.sample_buffer = []
 
-        # Insert temperature/humidity into database periodically
-        logging.debug(f'{datetime.now()}: inserting data into to table: {temperature},{humidity},{pressure}')
+        # Build the two statements once; constant text keeps sqlite's statement cache warm
+        self.insert_sql = f'INSERT INTO {TABLE} VALUES (?,?,?,?)'
+        self.purge_sql = f"DELETE FROM {TABLE} WHERE datetime < datetime('now','localtime','-365 days')"
 
-        # Insert temp and humidity data into table
-        sqlcmd = f"INSERT INTO {TABLE} VALUES (datetime('now','localtime'),{temperature},{humidity},{pressure})"
-        sqlcmd = sqlcmd.replace('None','NULL')
-        self.cursor.execute(sqlcmd)
-        logging.debug("{} record inserted.".format(self.cursor.rowcount))
+        # Queue incoming MQTT messages to a worker thread so the paho network thread
+        # only enqueues and can keep pulling packets from the broker
+        self.message_queue = Queue()
+        Thread(target=self.message_worker, daemon=True).start()
 
-        # Keep just the last year of readings
-        sqlcmd = f"DELETE FROM {TABLE} WHERE datetime < datetime('now','localtime','-365 days')"
-        self.cursor.execute(sqlcmd)
-        logging.debug("{} records deleted.".format(self.cursor.rowcount))
-        self.db.commit()
+    def message_worker(self):
+        ''' Worker thread to process MQTT messages queued by the network callback
+        '''
+        while True:
+            topic, payload = self.message_queue.get()
+            try:
+                self.process_message(topic, payload)
+            except Exception as e:
+                # Keep the worker alive on malformed payloads or handler errors
+                logging.error('Error processing MQTT message on %s: %s', topic, e)
+            self.message_queue.task_done()
 
     def timer_event(self):
         ''' Scheduler handler to periodically store sensor readings
@@ -168,115 +191,160 @@ class Events:
         # set next timer event
         self.scheduler.enter(TIMER_PERIOD, 1, self.timer_event)
 
+        # Skip the tick entirely if no new reading has arrived since the last one
+        if not self.sensors.updated:
+            logging.debug('no new sensor data since last tick...')
+            return
+        self.sensors.updated = False
+
         # first capture sensor readings
         temperature = self.sensors.get_temperature()
         humidity = self.sensors.get_humidity()
         pressure = self.sensors.get_pressure()
 
         # If there is no useful data, return rather than storing NULL data
-        if temperature==None and humidity==None and pressure==None:
-            logging.debug(f'{datetime.now()}: no valid data to store in table...')
+        if temperature is None and humidity is None and pressure is None:
+            logging.debug('no valid data to store in table...')
             return
 
-        # Insert temperature/humidity into database periodically
-        logging.debug(f'{datetime.now()}: inserting data into to table: {temperature},{humidity},{pressure}')
+        # Buffer the reading with its timestamp; flush to the database in batches
+        logging.debug('buffering data for table: %s,%s,%s', temperature, humidity, pressure)
+        self.sample_buffer.append((datetime.now().strftime('%Y-%m-%d %H:%M:%S'), temperature, humidity, pressure))
+        if len(self.sample_buffer) < SAMPLE_BATCH_SIZE:
+            return
 
-        # Insert temp and humidity data into table
-        sqlcmd = f"INSERT INTO {TABLE} VALUES (datetime('now','localtime'),{temperature},{humidity},{pressure})"
-        sqlcmd = sqlcmd.replace('None','NULL')
-        self.cursor.execute(sqlcmd)
-        logging.debug("{} record inserted.".format(self.cursor.rowcount))
+        # Insert buffered samples into table in one transaction (None values map to SQL NULL)
+        self.cursor.executemany(self.insert_sql, self.sample_buffer)
+        logging.debug('%s records inserted.', self.cursor.rowcount)
+        self.sample_buffer.clear()
 
-        # Keep just the last year of readings
-        sqlcmd = f"DELETE FROM {TABLE} WHERE datetime < datetime('now','localtime','-365 days')"
-        self.cursor.execute(sqlcmd)
-        logging.debug("{} records deleted.".format(self.cursor.rowcount))
+        # Keep just the last year of readings; purge no more than once per day
+        if date.today() != self.last_purge_day:
+            self.cursor.execute(self.purge_sql)
+            logging.debug('%s records deleted.', self.cursor.rowcount)
+            self.last_purge_day = date.today()
         self.db.commit()
 
     def mqtt_message_handler(self, client, data, msg):
-        ''' MQTT message handler for messages from sensors
-            Send e-mail alert when water leak or low battery detected
+        ''' MQTT callback: enqueue the message for the worker thread and return
         '''
-        message = str(msg.payload.decode("utf-8"))
-        sensor = msg.topic.split('/')[1]   # Extract sensor "friendly name" from MQTT topic
-        logging.debug(f'{datetime.now()} MQTT Message received from {sensor}: {message}')
-        status = json.loads(message) # Parse JSON message from sensor into a dictionary
-
-        # check MQTT dictionary keys for various variables exposed by sensors
-        # Water leak status
-        if "water_leak" in status:
-            if status['water_leak'] and sensor not in self.alarms:
-                logging.info(f'Water leak alarm detected for {sensor}!')
-                self.mail.send(f'Water leak alarm detected for {sensor}!',message)
-                self.alarms.append(sensor)
-                self.sensors.water_leak = True
-            elif not status['water_leak'] and sensor in self.alarms:
-                logging.info(f'Water leak alarm stopped for {sensor}!')
-                self.mail.send(f'Water leak alarm stopped for {sensor}',message)
-                self.alarms.remove(sensor)
-                self.sensors.water_leak = False
-
-        # Low battery status
-        if 'battery_low' in status and status['battery_low']:
+        self.message_queue.put((msg.topic, msg.payload))
+
+    def process_message(self, topic, payload):
+        ''' Process one MQTT message from a sensor by dispatching each payload
+            field present to its handler
+        '''
+        # Extract sensor "friendly name" from MQTT topic without building a full split list
+        sensor = topic.partition('/')[2].partition('/')[0]
+        # The wildcard subscription also delivers bulb/outlet messages; drop those
+        # before paying for the JSON parse
+        if sensor not in self.sensor_set:
+            logging.debug('Ignoring MQTT message from non-sensor device: %s', sensor)
+            return
+        status = json_loads(payload) # Parse JSON message from sensor into a dictionary (handles bytes directly)
+        logging.debug('MQTT Message received from %s: %s', sensor, status)
+
+        # Dispatch only the fields actually present in this payload
+        for key in status.keys() & self.field_handlers.keys():
+            self.field_handlers[key](sensor, status, payload)
+
+    def handle_water_leak(self, sensor, status, payload):
+        ''' Water leak status: alert only when the sensor's leak state changes
+        '''
+        leaking = bool(status['water_leak'])
+        if leaking == (sensor in self.alarms):
+            return   # no change: the common case costs one membership test
+        if leaking:
+            logging.info(f'Water leak alarm detected for {sensor}!')
+            self.mail.send(f'Water leak alarm detected for {sensor}!', payload.decode("utf-8"))
+            self.alarms.add(sensor)
+        else:
+            logging.info(f'Water leak alarm stopped for {sensor}!')
+            self.mail.send(f'Water leak alarm stopped for {sensor}', payload.decode("utf-8"))
+            self.alarms.discard(sensor)
+        # The leak flag reflects whether any sensor still reports a leak, so one
+        # sensor drying out no longer clears an alarm another sensor still holds
+        self.sensors.water_leak = not self.alarms.isdisjoint(self.sensor_set)
+
+    def handle_battery_low(self, sensor, status, payload):
+        ''' Low battery status: alert when a sensor reports a low battery
+        '''
+        if status['battery_low']:
             logging.info(f'Low battery detected for {sensor}!')
-            self.mail.send(f'Low battery detected for {sensor}!', message)
-
-        # temperature reading
-        if 'temperature' in status:
-            logging.debug(f'Temperature = {status["temperature"]} degrees C')
-            self.sensors.temperature = float(status['temperature'])
-            # Next, check temperature value; send an alert if it falls below a preset threshold
-            if self.sensors.is_low_temp() and LOW_TEMPERATURE_ALARM not in self.alarms:
-                message = f'The house temperature has fallen to: {status["temperature"]} degrees C!'
-                logging.info(f'{datetime.now()}: {message}')
-                self.mail.send('Home temperature warning!', message)
-                self.alarms.append(LOW_TEMPERATURE_ALARM)
-            # otherwise check if temperature returns back above threshold
-            elif self.sensors.is_temp_normal() and LOW_TEMPERATURE_ALARM in self.alarms:
-                message = f'The house temperature is now risen to {status["temperature"]} degrees C.'
-                logging.info(f'{datetime.now()}: {message}')
+            self.mail.send(f'Low battery detected for {sensor}!', payload.decode("utf-8"))
+
+    def handle_temperature(self, sensor, status, payload):
+        ''' Temperature reading: store it and manage the low/freezing alarms
+            Stateful hysteresis: each alarm tests the one threshold that matters
+            for the side of its band the reading is currently on
+        '''
+        sensors = self.sensors
+        temperature = float(status['temperature'])
+        logging.debug('Temperature = %s degrees C', temperature)
+        sensors.temperature = temperature
+        sensors.updated = True
+
+        # Low temperature alarm
+        if LOW_TEMPERATURE_ALARM in self.alarms:
+            if temperature > sensors.temp_normal_threshold:
+                message = f'The house temperature is now risen to {temperature} degrees C.'
+                logging.info(message)
                 self.mail.send('Home temperature update', message)
-                self.alarms.remove(LOW_TEMPERATURE_ALARM)
-            # check explicitly for freezing temperatures
-            elif self.sensors.is_freezing() and FREEZING_ALARM not in self.alarms:
-                message = f'The house temperature is freezing! Temperature={status["temperature"]} degrees C!'
-                logging.info(f'{datetime.now()}: {message}')
-                self.mail.send('Home temperature FREEZING!', message)
-                self.alarms.append(FREEZING_ALARM)
-            # otherwise check if things are no longer freezing
-            elif self.sensors.is_above_freezing() and FREEZING_ALARM in self.alarms:
-                message = f'The house temperature is now risen above freezing. Temperature={status["temperature"]} degrees C.'
-                logging.info(f'{datetime.now()}: {message}')
+                self.alarms.discard(LOW_TEMPERATURE_ALARM)
+        elif temperature < sensors.low_temp_threshold:
+            message = f'The house temperature has fallen to: {temperature} degrees C!'
+            logging.info(message)
+            self.mail.send('Home temperature warning!', message)
+            self.alarms.add(LOW_TEMPERATURE_ALARM)
+
+        # Freezing alarm (tracked independently of the low temperature alarm)
+        if FREEZING_ALARM in self.alarms:
+            if temperature > TEMPERATURE_HYSTERESIS:
+                message = f'The house temperature is now risen above freezing. Temperature={temperature} degrees C.'
+                logging.info(message)
                 self.mail.send('Home temperature update', message)
-                self.alarms.remove(FREEZING_ALARM)
-        
-        # Humidity reading
-        if 'humidity' in status:
-            logging.debug(f'Humidity = {status["humidity"]}')
-            self.sensors.humidity = float(status['humidity'])
-            # check humidity value; send an alert if it rises above a preset threshold
-            if self.sensors.is_high_humidity() and HUMIDITY_ALARM not in self.alarms:
-                message = f'The house humidity has risen to: {status["humidity"]}!'
-                logging.info(f'{datetime.now()}: {message}')
-                self.mail.send('Home humidity warning!', message)
-                self.alarms.append(HUMIDITY_ALARM)
-            # otherwise check if things are back to normal
-            elif self.sensors.is_humidity_normal() and HUMIDITY_ALARM in self.alarms:
-                message = f'The house humidity has now fallen to: {status["humidity"]}.'
-                logging.info(f'{datetime.now()}: {message}')
+                self.alarms.discard(FREEZING_ALARM)
+        elif temperature < 0.0:
+            message = f'The house temperature is freezing! Temperature={temperature} degrees C!'
+            logging.info(message)
+            self.mail.send('Home temperature FREEZING!', message)
+            self.alarms.add(FREEZING_ALARM)
+
+    def handle_humidity(self, sensor, status, payload):
+        ''' Humidity reading: store it and manage the high humidity alarm
+            Stateful hysteresis: one threshold test per reading
+        '''
+        sensors = self.sensors
+        humidity = float(status['humidity'])
+        logging.debug('Humidity = %s', humidity)
+        sensors.humidity = humidity
+        sensors.updated = True
+
+        if HUMIDITY_ALARM in self.alarms:
+            if humidity < sensors.humidity_normal_threshold:
+                message = f'The house humidity has now fallen to: {humidity}.'
+                logging.info(message)
                 self.mail.send('Home humidity update', message)
-                self.alarms.remove(HUMIDITY_ALARM)
-
-        # Air pressure
-        if 'pressure' in status:
-            logging.debug(f'Air pressure = {status["pressure"]} hPa')
-            self.sensors.pressure = float(status['pressure'])
+                self.alarms.discard(HUMIDITY_ALARM)
+        elif humidity > sensors.high_humidity_threshold:
+            message = f'The house humidity has risen to: {humidity}!'
+            logging.info(message)
+            self.mail.send('Home humidity warning!', message)
+            self.alarms.add(HUMIDITY_ALARM)
+
+    def handle_pressure(self, sensor, status, payload):
+        ''' Air pressure reading: store it
+        '''
+        logging.debug('Air pressure = %s hPa', status['pressure'])
+        self.sensors.pressure = float(status['pressure'])
+        self.sensors.updated = True
 
-        # Action messages are used to send miscellaneous info and alerts
-        if 'action' in status:
-            message = f'{sensor} reporting: {status["action"]}!'
-            logging.info(f'{datetime.now()}: {message}')
-            self.mail.send(f'{status["action"]} notification', message)
+    def handle_action(self, sensor, status, payload):
+        ''' Action messages are used to send miscellaneous info and alerts
+        '''
+        message = f'{sensor} reporting: {status["action"]}!'
+        logging.info(message)
+        self.mail.send(f'{status["action"]} notification', message)
 
 class Mail:
     ''' Class to encapsulate methods to send an alert email if sensor reading goes beyond 
@@ -288,41 +356,73 @@ class Mail:
         self.to_address = to_address        
         self.from_address = from_address
         self.server = server
+        self.smtp = None    # persistent SMTP session, opened on first send and reused
+
+        # Emails are sent from a worker thread so alert callers never block on SMTP I/O
+        self.queue = Queue()
+        Thread(target=self.send_worker, daemon=True).start()
+
+        # Plain-text alerts use this prebuilt header template, skipping the email
+        # package's message object and generator machinery on every send
+        self.plain_template = (f'From: {from_address}\r\nTo: {to_address}\r\nSubject: {{subject}}\r\n'
+                               f'Message-ID: {{message_id}}\r\nContent-Type: text/plain; charset=utf-8\r\n'
+                               f'Content-Transfer-Encoding: 8bit\r\n\r\n{{body}}')
+
+    def send_worker(self):
+        ''' Worker thread that builds and sends the queued emails
+            Transient failures are retried a few times with exponential backoff
+        '''
+        while True:
+            subject, message, html = self.queue.get()
+            for attempt in range(MAIL_SEND_ATTEMPTS):
+                if self.send_mail(subject, message, html):
+                    break
+                time.sleep(2 ** attempt)
+            self.queue.task_done()
 
     def send(self, subject, message, html=None):
-        ''' Function to send an email - requires SMTP server to forward mail
+        ''' Queue an email to be sent in the background - requires SMTP server to forward mail
             Includes optional support for html messages
         '''
         # if no to-address or server set then just return
         if self.to_address == '' or self.server == '':
             logging.debug('recipient address or SMTP server not set - no email sent')
             return
+        self.queue.put((subject, message, html))
+
+    def send_mail(self, subject, message, html=None):
+        ''' Build and send one email over the persistent SMTP session
+        '''
         
-        # message to be sent
+        # message to be sent: plain alerts use the prebuilt template, html messages
+        # still go through a MIME container with both parts attached
         if html == None:
-            msg = MIMEText(message)
+            data = self.plain_template.format(subject=subject, message_id=make_msgid(), body=message).encode('utf-8')
         else:
             msg = MIMEMultipart('alternative')
-        msg['To'] = self.to_address
-        msg['From'] = self.from_address
-        msg['Subject'] = subject
-        msg['Message-ID'] = make_msgid()
-
-        # If html part present, set the MIME types of both parts - plain and html
-        # and attach parts into message container.
-        if html != None:
+            msg['To'] = self.to_address
+            msg['From'] = self.from_address
+            msg['Subject'] = subject
+            msg['Message-ID'] = make_msgid()
             msg.attach(MIMEText(message, 'plain'))
             msg.attach(MIMEText(html, 'html'))
+            data = msg.as_string()
 
-        # send the mail and terminate the session
+        # send the mail, keeping the SMTP session open for the next alert
         try:
-            # creates SMTP session and sends mail
-            s = smtplib.SMTP(self.server)
-            s.sendmail(self.from_address, self.to_address, msg.as_string())
-            logging.info(f'{datetime.now()}: Email alert sent to {self.to_address}')
-            s.quit()
-        except:
-            logging.info(f'{datetime.now()}: Email alert failed to send!')
+            # Reuse the session when the server still responds; otherwise reconnect
+            try:
+                if self.smtp is None or self.smtp.noop()[0] != 250:
+                    self.smtp = smtplib.SMTP(self.server, timeout=10)
+            except (smtplib.SMTPException, OSError):
+                self.smtp = smtplib.SMTP(self.server, timeout=10)
+            self.smtp.sendmail(self.from_address, self.to_address, data)
+            logging.info(f'Email alert sent to {self.to_address}')
+            return True
+        except Exception as e:
+            logging.info(f'Email alert failed to send: {e}')
+            self.smtp = None
+            return False
 
 # Self test code
 if __name__ == '__main__':